@@ -4,29 +4,19 @@ Generation MCP Server for GraphRAG Pattern
 Integrates with Ollama for local LLM inference
 """
 
+from __future__ import annotations
+
 import asyncio
-import json
 import logging
-from typing import Any, Dict, List, Optional, Sequence
+import os
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
 
 import httpx
-from mcp.server.models import InitializationOptions
-from mcp.server.server import NotificationOptions, Server
-from mcp.server.stdio import stdio_server
-from mcp.types import (
-    CallToolRequest,
-    CallToolResult,
-    ListResourcesRequest,
-    ListResourcesResult,
-    ListToolsRequest,
-    ListToolsResult,
-    ReadResourceRequest,
-    ReadResourceResult,
-    Resource,
-    TextContent,
-    Tool,
-)
-from pydantic import BaseModel, Field
+import orjson
+from cachetools import TTLCache
+from mcp.server.server import Server
+from mcp.types import Resource, TextContent, Tool
+from pydantic import BaseModel
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -35,21 +25,86 @@ logger = logging.getLogger(__name__)
 class OllamaClient:
     """Client for interacting with Ollama API"""
     
-    def __init__(self, base_url: str = "http://localhost:11434"):
+    def __init__(self, base_url: str = "http://localhost:11434", keep_alive: str = "30m"):
         self.base_url = base_url.rstrip("/")
-        self.client = httpx.AsyncClient(timeout=60.0)
+        # How long Ollama keeps the model (and its prompt KV cache) loaded
+        # after a request, so calls sharing a context prefix skip re-prefill
+        self.keep_alive = keep_alive
+        # One pooled HTTP/2 client is shared by every tool call so requests
+        # reuse open connections instead of reconnecting to Ollama each time
+        self.client = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(60.0, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=32,
+                max_keepalive_connections=32,
+                keepalive_expiry=90
+            )
+        )
+        # Short-lived caches for idempotent calls: the model list and health
+        # rarely change, and temperature 0 generations are deterministic
+        self.models_cache = TTLCache(maxsize=1, ttl=10)
+        self.health_cache = TTLCache(maxsize=1, ttl=10)
+        self.generation_cache = TTLCache(maxsize=1024, ttl=300)
+        self._cache_locks: Dict[Any, asyncio.Lock] = {}
+    
+    async def close(self):
+        """Close the underlying HTTP client"""
+        await self.client.aclose()
+    
+    async def _cached(self, cache: TTLCache, key: Any, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Return cache[key], calling fetch() only once per key on a miss"""
+        if key in cache:
+            return cache[key]
+        
+        # Concurrent misses on the same key wait for the first fetch
+        lock = self._cache_locks.setdefault(key, asyncio.Lock())
+        try:
+            async with lock:
+                if key in cache:
+                    return cache[key]
+                value = await fetch()
+                cache[key] = value
+                return value
+        finally:
+            if not lock.locked():
+                self._cache_locks.pop(key, None)
+    
+    async def _fetch_models(self) -> List[Dict[str, Any]]:
+        """Fetch the model list from Ollama"""
+        response = await self.client.get(f"{self.base_url}/api/tags")
+        response.raise_for_status()
+        data = orjson.loads(response.content)
+        return data.get("models", [])
     
     async def list_models(self) -> List[Dict[str, Any]]:
         """List available models from Ollama"""
         try:
-            response = await self.client.get(f"{self.base_url}/api/tags")
-            response.raise_for_status()
-            data = response.json()
-            return data.get("models", [])
+            return await self._cached(self.models_cache, "models", self._fetch_models)
         except Exception as e:
             logger.error(f"Failed to list models: {e}")
             return []
     
+    async def _stream(self, url: str, payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """Yield the NDJSON chunks of a streaming Ollama response"""
+        async with self.client.stream(
+            "POST",
+            url,
+            content=orjson.dumps(payload),
+            headers={"Content-Type": "application/json"}
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                chunk = orjson.loads(line)
+                # Ollama reports failures mid-stream as an error chunk after the 200
+                if "error" in chunk:
+                    raise RuntimeError(f"Ollama error: {chunk['error']}")
+                yield chunk
+                if chunk.get("done"):
+                    break
+    
     async def generate(self, 
                       prompt: str, 
                       model: str = "llama3.2:latest", 
@@ -59,34 +114,52 @@ class OllamaClient:
                       max_tokens: Optional[int] = None) -> str:
         """Generate text using Ollama"""
         
-        # Prepare the full prompt with context if provided
-        full_prompt = prompt
         if context:
-            full_prompt = f"Context:\n{context}\n\nQuestion: {prompt}"
-        
-        payload = {
-            "model": model,
-            "prompt": full_prompt,
-            "stream": False,
-            "options": {
-                "temperature": temperature
+            # Send system prompt and context as their own messages ahead of the
+            # question. Ollama templates them identically on every call, so
+            # questions over the same retrieved context reuse its prompt cache.
+            messages = []
+            if system:
+                messages.append({"role": "system", "content": system})
+            messages.append({"role": "user", "content": f"Context:\n{context}"})
+            messages.append({"role": "user", "content": prompt})
+            
+            async def fetch() -> str:
+                return await self.chat(
+                    messages=messages,
+                    model=model,
+                    temperature=temperature,
+                    max_tokens=max_tokens
+                )
+        else:
+            payload = {
+                "model": model,
+                "prompt": prompt,
+                "stream": True,
+                "keep_alive": self.keep_alive,
+                "options": {
+                    "temperature": temperature
+                }
             }
-        }
-        
-        if system:
-            payload["system"] = system
             
-        if max_tokens:
-            payload["options"]["num_predict"] = max_tokens
+            if system:
+                payload["system"] = system
+                
+            if max_tokens:
+                payload["options"]["num_predict"] = max_tokens
+            
+            async def fetch() -> str:
+                # Stream tokens as Ollama produces them and assemble the full text
+                parts = []
+                async for chunk in self._stream(f"{self.base_url}/api/generate", payload):
+                    parts.append(chunk.get("response", ""))
+                return "".join(parts)
         
         try:
-            response = await self.client.post(
-                f"{self.base_url}/api/generate",
-                json=payload
-            )
-            response.raise_for_status()
-            result = response.json()
-            return result.get("response", "")
+            if temperature == 0:
+                key = ("generate", model, system, context, prompt, max_tokens)
+                return await self._cached(self.generation_cache, key, fetch)
+            return await fetch()
         except Exception as e:
             logger.error(f"Generation failed: {e}")
             raise
@@ -101,7 +174,8 @@ class OllamaClient:
         payload = {
             "model": model,
             "messages": messages,
-            "stream": False,
+            "stream": True,
+            "keep_alive": self.keep_alive,
             "options": {
                 "temperature": temperature
             }
@@ -111,27 +185,31 @@ class OllamaClient:
             payload["options"]["num_predict"] = max_tokens
         
         try:
-            response = await self.client.post(
-                f"{self.base_url}/api/chat",
-                json=payload
-            )
-            response.raise_for_status()
-            result = response.json()
-            return result.get("message", {}).get("content", "")
+            parts = []
+            async for chunk in self._stream(f"{self.base_url}/api/chat", payload):
+                parts.append(chunk.get("message", {}).get("content", ""))
+            return "".join(parts)
         except Exception as e:
             logger.error(f"Chat completion failed: {e}")
             raise
     
-    async def check_health(self) -> bool:
-        """Check if Ollama is running and accessible"""
+    async def _fetch_health(self) -> bool:
+        """Ping the Ollama version endpoint"""
         try:
             response = await self.client.get(f"{self.base_url}/api/version")
             return response.status_code == 200
         except Exception:
             return False
+    
+    async def check_health(self) -> bool:
+        """Check if Ollama is running and accessible"""
+        return await self._cached(self.health_cache, "health", self._fetch_health)
 
 # Initialize Ollama client
-ollama = OllamaClient()
+ollama = OllamaClient(
+    base_url=os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"),
+    keep_alive=os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+)
 
 # Create the server instance
 server = Server("graphrag-generation-server")
@@ -159,10 +237,10 @@ async def handle_read_resource(uri: str) -> str:
     """Read resource content"""
     if uri == "generation://models":
         models = await ollama.list_models()
-        return json.dumps({"models": models}, indent=2)
+        return orjson.dumps({"models": models}, option=orjson.OPT_INDENT_2).decode()
     elif uri == "generation://health":
         health = await ollama.check_health()
-        return json.dumps({"healthy": health, "service": "ollama"}, indent=2)
+        return orjson.dumps({"healthy": health, "service": "ollama"}, option=orjson.OPT_INDENT_2).decode()
     else:
         raise ValueError(f"Unknown resource: {uri}")
 
@@ -206,6 +284,45 @@ async def handle_list_tools() -> List[Tool]:
                 "required": ["prompt"]
             }
         ),
+        Tool(
+            name="generate_batch",
+            description="Generate text for several prompts concurrently, sharing model, system prompt and context",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "prompts": {
+                        "type": "array",
+                        "items": {
+                            "type": "string"
+                        },
+                        "description": "The prompts for text generation"
+                    },
+                    "model": {
+                        "type": "string",
+                        "description": "The Ollama model to use",
+                        "default": "llama3.2:latest"
+                    },
+                    "max_tokens": {
+                        "type": "integer",
+                        "description": "Maximum tokens to generate per prompt"
+                    },
+                    "temperature": {
+                        "type": "number",
+                        "description": "Sampling temperature (0.0 to 1.0)",
+                        "default": 0.7
+                    },
+                    "context": {
+                        "type": "string",
+                        "description": "Additional context from retrieval, shared by all prompts"
+                    },
+                    "system_prompt": {
+                        "type": "string",
+                        "description": "System prompt for the model"
+                    }
+                },
+                "required": ["prompts"]
+            }
+        ),
         Tool(
             name="chat_completion",
             description="Chat completion using Ollama LLM",
@@ -257,88 +374,125 @@ async def handle_list_tools() -> List[Tool]:
         )
     ]
 
+class GenerateArgs(BaseModel):
+    """Arguments for the generate_text tool"""
+    prompt: str
+    model: str = "llama3.2:latest"
+    max_tokens: Optional[int] = None
+    temperature: float = 0.7
+    context: Optional[str] = None
+    system_prompt: Optional[str] = None
+
+class GenerateBatchArgs(BaseModel):
+    """Arguments for the generate_batch tool"""
+    prompts: List[str]
+    model: str = "llama3.2:latest"
+    max_tokens: Optional[int] = None
+    temperature: float = 0.7
+    context: Optional[str] = None
+    system_prompt: Optional[str] = None
+
+class ChatArgs(BaseModel):
+    """Arguments for the chat_completion tool"""
+    messages: List[Dict[str, str]]
+    model: str = "llama3.2:latest"
+    temperature: float = 0.7
+    max_tokens: Optional[int] = None
+
+class ListModelsArgs(BaseModel):
+    """Arguments for the list_models tool"""
+
+async def generate_text(args: GenerateArgs) -> str:
+    """Run the generate_text tool"""
+    return await ollama.generate(
+        prompt=args.prompt,
+        model=args.model,
+        system=args.system_prompt,
+        context=args.context,
+        temperature=args.temperature,
+        max_tokens=args.max_tokens
+    )
+
+async def generate_batch(args: GenerateBatchArgs) -> Dict[str, Any]:
+    """Run the generate_batch tool"""
+    # Every prompt shares the same system prompt and context, so the
+    # requests reuse the same cached prefix while the model stays loaded
+    results = await asyncio.gather(*[
+        ollama.generate(
+            prompt=prompt,
+            model=args.model,
+            system=args.system_prompt,
+            context=args.context,
+            temperature=args.temperature,
+            max_tokens=args.max_tokens
+        )
+        for prompt in args.prompts
+    ], return_exceptions=True)
+    
+    return {
+        "results": [
+            f"Generation failed: {str(result)}" if isinstance(result, Exception) else result
+            for result in results
+        ],
+        "count": len(results)
+    }
+
+async def chat_completion(args: ChatArgs) -> str:
+    """Run the chat_completion tool"""
+    return await ollama.chat(
+        messages=args.messages,
+        model=args.model,
+        temperature=args.temperature,
+        max_tokens=args.max_tokens
+    )
+
+async def list_models(args: ListModelsArgs) -> Dict[str, Any]:
+    """Run the list_models tool"""
+    models = await ollama.list_models()
+    model_list = [model.get("name", "unknown") for model in models]
+    return {
+        "available_models": model_list,
+        "count": len(model_list)
+    }
+
+# Tool name -> (argument model, handler, error message prefix)
+TOOL_HANDLERS = {
+    "generate_text": (GenerateArgs, generate_text, "Generation failed"),
+    "generate_batch": (GenerateBatchArgs, generate_batch, "Batch generation failed"),
+    "chat_completion": (ChatArgs, chat_completion, "Chat completion failed"),
+    "list_models": (ListModelsArgs, list_models, "Failed to list models"),
+}
+
 @server.call_tool()
 async def handle_call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
     """Handle tool calls"""
+    if name not in TOOL_HANDLERS:
+        raise ValueError(f"Unknown tool: {name}")
     
-    if name == "generate_text":
-        prompt = arguments.get("prompt", "")
-        model = arguments.get("model", "llama3.2:latest")
-        max_tokens = arguments.get("max_tokens")
-        temperature = arguments.get("temperature", 0.7)
-        context = arguments.get("context")
-        system_prompt = arguments.get("system_prompt")
-        
-        try:
-            result = await ollama.generate(
-                prompt=prompt,
-                model=model,
-                system=system_prompt,
-                context=context,
-                temperature=temperature,
-                max_tokens=max_tokens
-            )
-            
-            return [TextContent(
-                type="text",
-                text=result
-            )]
-            
-        except Exception as e:
-            return [TextContent(
-                type="text", 
-                text=f"Generation failed: {str(e)}"
-            )]
-    
-    elif name == "chat_completion":
-        messages = arguments.get("messages", [])
-        model = arguments.get("model", "llama3.2:latest")
-        temperature = arguments.get("temperature", 0.7)
-        max_tokens = arguments.get("max_tokens")
-        
-        try:
-            result = await ollama.chat(
-                messages=messages,
-                model=model,
-                temperature=temperature,
-                max_tokens=max_tokens
-            )
-            
-            return [TextContent(
-                type="text",
-                text=result
-            )]
-            
-        except Exception as e:
-            return [TextContent(
-                type="text",
-                text=f"Chat completion failed: {str(e)}"
-            )]
+    args_model, handler, error_prefix = TOOL_HANDLERS[name]
+    try:
+        result = await handler(args_model.model_validate(arguments or {}))
+    except Exception as e:
+        return [TextContent(
+            type="text",
+            text=f"{error_prefix}: {str(e)}"
+        )]
     
-    elif name == "list_models":
-        try:
-            models = await ollama.list_models()
-            model_list = [model.get("name", "unknown") for model in models]
-            
-            return [TextContent(
-                type="text",
-                text=json.dumps({
-                    "available_models": model_list,
-                    "count": len(model_list)
-                }, indent=2)
-            )]
-            
-        except Exception as e:
-            return [TextContent(
-                type="text",
-                text=f"Failed to list models: {str(e)}"
-            )]
+    if not isinstance(result, str):
+        result = orjson.dumps(result, option=orjson.OPT_INDENT_2).decode()
     
-    else:
-        raise ValueError(f"Unknown tool: {name}")
+    return [TextContent(
+        type="text",
+        text=result
+    )]
 
 async def main():
     """Main entry point for the server"""
+    # Only needed once the stdio transport starts, so keep them off the import path
+    from mcp.server.models import InitializationOptions
+    from mcp.server.server import NotificationOptions
+    from mcp.server.stdio import stdio_server
+    
     # Check Ollama health on startup
     health = await ollama.check_health()
     if not health:
@@ -348,19 +502,29 @@ async def main():
         logger.info(f"Connected to Ollama. Available models: {len(models)}")
     
     # Run the server
-    async with stdio_server() as (read_stream, write_stream):
-        await server.run(
-            read_stream,
-            write_stream,
-            InitializationOptions(
-                server_name="graphrag-generation-server",
-                server_version="1.0.0",
-                capabilities=server.get_capabilities(
-                    notification_options=NotificationOptions(),
-                    experimental_capabilities={}
+    try:
+        async with stdio_server() as (read_stream, write_stream):
+            await server.run(
+                read_stream,
+                write_stream,
+                InitializationOptions(
+                    server_name="graphrag-generation-server",
+                    server_version="1.0.0",
+                    capabilities=server.get_capabilities(
+                        notification_options=NotificationOptions(),
+                        experimental_capabilities={}
+                    )
                 )
             )
-        )
+    finally:
+        await ollama.close()
 
 if __name__ == "__main__":
+    # Use the libuv-based event loop when available (not on Windows)
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+    
     asyncio.run(main())
\ No newline at end of file
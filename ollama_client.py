@@ -0,0 +1,316 @@
+"""
+Shared Ollama client for the generation server and test scripts
+Keeps one pooled HTTP client per instance; use it as an async context manager
+so the connections are closed when done
+"""
+
+import asyncio
+import logging
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+import orjson
+from tenacity import AsyncRetrying, RetryError, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+
+logger = logging.getLogger(__name__)
+
+# Upstream statuses worth retrying: Ollama answers 503 while a model is loading
+RETRY_STATUSES = frozenset({502, 503, 504})
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+def is_transient(error: BaseException) -> bool:
+    """Whether a failed Ollama call may succeed if retried"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRY_STATUSES
+    return isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.ReadTimeout))
+
+class OllamaUnavailableError(Exception):
+    """Ollama was unreachable or overloaded on every attempt"""
+    
+    def __init__(self, message: str, retry_after: int = 5):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class OllamaClient:
+    """Simple Ollama client"""
+    
+    def __init__(self,
+                 base_url: str = "http://localhost:11434",
+                 limits: Optional[httpx.Limits] = None,
+                 http2: bool = False,
+                 timeout: Any = 60.0,
+                 max_inflight: int = 4,
+                 model_slots: int = 2,
+                 max_attempts: int = 4,
+                 keep_alive: str = "30m",
+                 num_ctx: Optional[int] = None):
+        self.base_url = base_url.rstrip("/")
+        # Endpoint URLs are built once rather than on every call
+        self._generate_url = f"{self.base_url}/api/generate"
+        self._chat_url = f"{self.base_url}/api/chat"
+        self._embeddings_url = f"{self.base_url}/api/embeddings"
+        self._tags_url = f"{self.base_url}/api/tags"
+        self._version_url = f"{self.base_url}/api/version"
+        # Keeping the model loaded (and a fixed context size) lets Ollama
+        # reuse the KV cache for prompts that share a prefix
+        self.keep_alive = keep_alive
+        self.num_ctx = num_ctx
+        self.client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=limits or httpx.Limits(),
+            http2=http2
+        )
+        self._get = self.client.get
+        self._send = self.client.send
+        # Ollama serves one prompt per request and has no batch endpoint, so
+        # bound the generations in flight instead of overloading the GPU
+        self.inflight = asyncio.Semaphore(max_inflight)
+        # Each model also gets its own slots; requests beyond them queue here
+        # rather than on the GPU
+        self.model_slots = model_slots
+        self._model_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.queued = Counter()
+        self.active = Counter()
+        self.max_attempts = max_attempts
+    
+    async def close(self):
+        """Close the underlying HTTP client"""
+        await self.client.aclose()
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+    
+    async def list_models(self):
+        """List available models"""
+        try:
+            response = await self._get(self._tags_url)
+            response.raise_for_status()
+            return orjson.loads(response.content)
+        except Exception as e:
+            logger.error("Failed to list models: %s", e)
+            raise
+    
+    async def embed(self, text: str, model: str = "nomic-embed-text") -> List[float]:
+        """Embed text with an Ollama embedding model"""
+        payload = {"model": model, "prompt": text, "keep_alive": self.keep_alive}
+        
+        try:
+            response = await self._send_with_retry(self._embeddings_url, payload)
+            response.raise_for_status()
+            return orjson.loads(response.content)["embedding"]
+        except Exception as e:
+            logger.error("Embedding failed: %s", e)
+            raise
+    
+    def _generate_payload(self,
+                          prompt: str,
+                          model: str,
+                          system: Optional[str],
+                          context: Optional[str],
+                          temperature: float,
+                          max_tokens: Optional[int]):
+        """Build the /api/generate request body"""
+        
+        # Prepare the full prompt with context if provided. The system prompt
+        # and context come first so repeated contexts share a cacheable prefix.
+        full_prompt = prompt
+        if context:
+            full_prompt = f"Context:\n{context}\n\nQuestion: {prompt}"
+        
+        payload = {
+            "model": model,
+            "prompt": full_prompt,
+            "stream": True,
+            "keep_alive": self.keep_alive,
+            "options": self._options(temperature, max_tokens)
+        }
+        
+        if system:
+            payload["system"] = system
+        
+        return payload
+    
+    def _options(self, temperature: float, max_tokens: Optional[int]) -> Dict[str, Any]:
+        """Build the Ollama model options"""
+        options = {"temperature": temperature}
+        
+        if max_tokens:
+            options["num_predict"] = max_tokens
+        
+        # Changing num_ctx between calls reloads the model, so it is fixed per client
+        if self.num_ctx:
+            options["num_ctx"] = self.num_ctx
+        
+        return options
+    
+    @asynccontextmanager
+    async def _slot(self, model: str):
+        """Wait for a free slot for the model and for the global in-flight cap"""
+        semaphore = self._model_semaphores.setdefault(model, asyncio.Semaphore(self.model_slots))
+        
+        self.queued[model] += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.queued[model] -= 1
+        
+        try:
+            async with self.inflight:
+                self.active[model] += 1
+                try:
+                    yield
+                finally:
+                    self.active[model] -= 1
+        finally:
+            semaphore.release()
+    
+    def metrics(self) -> Dict[str, Any]:
+        """Report queued and active generations per model"""
+        return {
+            "model_slots": self.model_slots,
+            "models": {
+                model: {"queued": self.queued[model], "active": self.active[model]}
+                for model in self._model_semaphores
+            }
+        }
+    
+    async def _send_with_retry(self, url: str, payload: Dict[str, Any], stream: bool = False) -> httpx.Response:
+        """POST to Ollama, retrying connection failures and 502/503/504 with backoff
+        
+        Only the request itself is retried; once a response with a usable status
+        arrives it is returned, so streamed output is never replayed.
+        """
+        # Serialized with orjson and sent as raw content, bypassing httpx's json encoder
+        content = orjson.dumps(payload)
+        response = None
+        
+        try:
+            async for attempt in AsyncRetrying(
+                retry=retry_if_exception(is_transient),
+                wait=wait_exponential_jitter(initial=0.1, max=2.0),
+                stop=stop_after_attempt(self.max_attempts)
+            ):
+                with attempt:
+                    request = self.client.build_request("POST", url, content=content, headers=JSON_HEADERS)
+                    response = await self._send(request, stream=stream)
+                    if response.status_code in RETRY_STATUSES:
+                        await response.aclose()
+                        response.raise_for_status()
+        except RetryError as e:
+            error = e.last_attempt.exception()
+            retry_after = 5
+            if isinstance(error, httpx.HTTPStatusError):
+                # Pass on Ollama's own hint when it sends one
+                header = error.response.headers.get("Retry-After", "")
+                if header.isdigit():
+                    retry_after = int(header)
+            raise OllamaUnavailableError(f"Ollama unavailable after {self.max_attempts} attempts: {error}", retry_after) from error
+        
+        return response
+    
+    async def _stream(self, url: str, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        """POST to Ollama and yield each NDJSON line as it arrives"""
+        async with self._slot(payload["model"]):
+            response = await self._send_with_retry(url, payload, stream=True)
+            try:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if line:
+                        yield line
+            finally:
+                await response.aclose()
+    
+    async def _chunks(self, lines: AsyncIterator[str]) -> AsyncIterator[Dict[str, Any]]:
+        """Parse NDJSON lines, raising on a failure reported mid-stream"""
+        async for line in lines:
+            chunk = orjson.loads(line)
+            # Ollama reports failures mid-stream as an error chunk after the 200
+            if "error" in chunk:
+                raise RuntimeError(f"Ollama error: {chunk['error']}")
+            yield chunk
+    
+    async def generate_stream(self, 
+                              prompt: str, 
+                              model: str = "llama3.2:latest",
+                              system: Optional[str] = None,
+                              context: Optional[str] = None,
+                              temperature: float = 0.7,
+                              max_tokens: Optional[int] = None) -> AsyncIterator[str]:
+        """Stream generated text as Ollama NDJSON chunks"""
+        payload = self._generate_payload(prompt, model, system, context, temperature, max_tokens)
+        
+        try:
+            async for line in self._stream(self._generate_url, payload):
+                yield line
+        except Exception as e:
+            logger.error("Generation failed: %s", e)
+            raise
+    
+    async def generate(self, 
+                      prompt: str, 
+                      model: str = "llama3.2:latest",
+                      system: Optional[str] = None,
+                      context: Optional[str] = None,
+                      temperature: float = 0.7,
+                      max_tokens: Optional[int] = None):
+        """Generate text"""
+        
+        # Consume the stream and join the response fragments
+        parts = []
+        result = {}
+        async for result in self._chunks(self.generate_stream(prompt, model, system, context, temperature, max_tokens)):
+            parts.append(result.get("response", ""))
+        
+        result["response"] = "".join(parts)
+        return result
+    
+    async def chat_stream(self, 
+                          messages: List[Dict[str, str]], 
+                          model: str = "llama3.2:latest",
+                          temperature: float = 0.7,
+                          max_tokens: Optional[int] = None) -> AsyncIterator[str]:
+        """Stream a chat completion as Ollama NDJSON chunks"""
+        
+        payload = {
+            "model": model,
+            "messages": messages,
+            "stream": True,
+            "keep_alive": self.keep_alive,
+            "options": self._options(temperature, max_tokens)
+        }
+        
+        try:
+            async for line in self._stream(self._chat_url, payload):
+                yield line
+        except Exception as e:
+            logger.error("Chat completion failed: %s", e)
+            raise
+    
+    async def chat(self, 
+                   messages: List[Dict[str, str]], 
+                   model: str = "llama3.2:latest",
+                   temperature: float = 0.7,
+                   max_tokens: Optional[int] = None):
+        """Chat completion"""
+        
+        # Consume the stream and join the message fragments
+        parts = []
+        result = {}
+        async for result in self._chunks(self.chat_stream(messages, model, temperature, max_tokens)):
+            parts.append(result.get("message", {}).get("content", ""))
+        
+        result["message"] = {"role": "assistant", "content": "".join(parts)}
+        return result
+    
+    async def check_health(self):
+        """Check if Ollama is accessible"""
+        try:
+            response = await self._get(self._version_url)
+            return response.status_code == 200
+        except Exception:
+            return False
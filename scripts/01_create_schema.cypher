@@ -17,4 +17,7 @@ CREATE INDEX author_name IF NOT EXISTS FOR (a:Author) ON (a.name);
 CREATE INDEX institution_name IF NOT EXISTS FOR (i:Institution) ON (i.name);
 CREATE INDEX topic_name IF NOT EXISTS FOR (t:Topic) ON (t.name);
 
+// Text index so CONTAINS searches on paper titles use an index seek
+CREATE TEXT INDEX paper_title_text IF NOT EXISTS FOR (p:Paper) ON (p.title);
+
 // Schema is now ready for data population
\ No newline at end of file
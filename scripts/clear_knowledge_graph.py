@@ -4,12 +4,14 @@ Clear Knowledge Graph Data
 Removes all data populated by 02_populate_data.cypher while preserving schema
 """
 
+import argparse
+import asyncio
 import os
 import sys
 from pathlib import Path
-from neo4j import GraphDatabase
 import logging
 from dotenv import load_dotenv
+from graph_driver import close_driver, get_driver
 
 # Load environment variables
 load_dotenv()
@@ -29,45 +31,69 @@ class KnowledgeGraphCleaner:
             raise ValueError("NEO4J_USER and NEO4J_PASSWORD environment variables must be set")
         
         logger.info(f"Connecting to Neo4j at {self.uri} as {self.user}")
-        self.driver = GraphDatabase.driver(self.uri, auth=(self.user, self.password))
+        self.driver = get_driver(self.uri, self.user, self.password)
+        self.delete_batch_size = int(os.getenv("NEO4J_DELETE_BATCH_SIZE", "10000"))
     
-    def close(self):
+    async def close(self):
         """Close the connection"""
-        self.driver.close()
+        await close_driver()
     
-    def count_data(self):
+    async def count_data(self):
         """Count current nodes and relationships"""
-        with self.driver.session() as session:
-            # Count nodes
-            node_result = session.run("MATCH (n) RETURN count(n) as count")
-            node_count = node_result.single()["count"]
+        async with self.driver.session() as session:
+            # Both counts come from the count store in a single round-trip
+            result = await session.run("""
+                CALL { MATCH (n) RETURN count(n) AS node_count }
+                CALL { MATCH ()-[r]->() RETURN count(r) AS rel_count }
+                RETURN node_count, rel_count
+            """)
+            record = await result.single()
             
-            # Count relationships
-            rel_result = session.run("MATCH ()-[r]-() RETURN count(r) as count")
-            rel_count = rel_result.single()["count"]
-            
-            return node_count, rel_count
+            return record["node_count"], record["rel_count"]
     
-    def clear_all_data(self):
+    async def clear_all_data(self):
         """Remove all nodes and relationships but preserve schema"""
         logger.info("Clearing all data from knowledge graph...")
         
-        with self.driver.session() as session:
-            # Remove all relationships first
-            logger.info("Removing all relationships...")
-            result = session.run("MATCH ()-[r]-() DELETE r")
+        async with self.driver.session() as session:
+            # DETACH DELETE removes relationships with their nodes; the server
+            # commits in bounded batches so large graphs don't exhaust the heap.
+            # CALL { ... } IN TRANSACTIONS must run in an auto-commit transaction.
+            logger.info(f"Removing all nodes and relationships in batches of {self.delete_batch_size}...")
+            result = await session.run(
+                "MATCH (n) CALL { WITH n DETACH DELETE n } "
+                f"IN TRANSACTIONS OF {self.delete_batch_size} ROWS"
+            )
+            await result.consume()
+        
+        logger.info("Data clearing complete!")
+    
+    async def count_schema(self):
+        """Count constraints and indexes"""
+        async with self.driver.session() as session:
+            # Counted on the server; SHOW commands can't be combined with
+            # UNION, so this takes two queries
+            result = await session.run("SHOW CONSTRAINTS YIELD name RETURN count(*) AS count")
+            constraint_count = (await result.single())["count"]
             
-            # Remove all nodes
-            logger.info("Removing all nodes...")
-            result = session.run("MATCH (n) DELETE n")
+            result = await session.run("SHOW INDEXES YIELD name RETURN count(*) AS count")
+            index_count = (await result.single())["count"]
             
-        logger.info("Data clearing complete!")
+            return constraint_count, index_count
     
-    def verify_cleanup(self):
+    async def verify_cleanup(self):
         """Verify that all data has been removed"""
         logger.info("Verifying cleanup...")
         
-        node_count, rel_count = self.count_data()
+        # The data and schema checks are independent, so run them together
+        data_counts, schema_counts = await asyncio.gather(
+            self.count_data(),
+            self.count_schema(),
+            return_exceptions=True
+        )
+        if isinstance(data_counts, Exception):
+            raise data_counts
+        node_count, rel_count = data_counts
         
         if node_count == 0 and rel_count == 0:
             logger.info("✅ All data successfully removed")
@@ -76,23 +102,27 @@ class KnowledgeGraphCleaner:
             logger.warning(f"⚠️  Cleanup incomplete: {node_count} nodes, {rel_count} relationships remain")
         
         # Show preserved schema
-        with self.driver.session() as session:
-            try:
-                # Count constraints
-                constraints_result = session.run("SHOW CONSTRAINTS")
-                constraints = list(constraints_result)
-                logger.info(f"📝 {len(constraints)} constraints preserved")
-                
-                # Count indexes  
-                indexes_result = session.run("SHOW INDEXES")
-                indexes = list(indexes_result)
-                logger.info(f"🔍 {len(indexes)} indexes preserved")
-                
-            except Exception as e:
-                logger.debug(f"Could not show schema info: {e}")
+        if isinstance(schema_counts, Exception):
+            logger.debug(f"Could not show schema info: {schema_counts}")
+        else:
+            constraint_count, index_count = schema_counts
+            logger.info(f"📝 {constraint_count} constraints preserved")
+            logger.info(f"🔍 {index_count} indexes preserved")
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Remove all knowledge graph data while preserving schema")
+    parser.add_argument(
+        "--yes", "-y",
+        action="store_true",
+        help="Skip the confirmation prompt (or set NEO4J_CLEAR_YES=1)"
+    )
+    return parser.parse_args()
 
-def main():
+async def main():
     """Main cleanup function"""
+    args = parse_args()
+    skip_confirmation = args.yes or os.getenv("NEO4J_CLEAR_YES") == "1"
     
     try:
         # Initialize cleaner
@@ -100,13 +130,13 @@ def main():
         
         # Test connection
         logger.info("Testing Neo4j connection...")
-        with cleaner.driver.session() as session:
-            result = session.run("RETURN 'Connection successful' as message")
-            message = result.single()["message"]
+        async with cleaner.driver.session() as session:
+            result = await session.run("RETURN 'Connection successful' as message")
+            message = (await result.single())["message"]
             logger.info(f"✅ {message}")
         
         # Show current state
-        node_count, rel_count = cleaner.count_data()
+        node_count, rel_count = await cleaner.count_data()
         logger.info(f"Current state: {node_count} nodes, {rel_count} relationships")
         
         if node_count == 0 and rel_count == 0:
@@ -114,15 +144,16 @@ def main():
             return
         
         # Confirm deletion
-        response = input(f"\n⚠️  This will DELETE all {node_count} nodes and {rel_count} relationships.\nSchema (constraints/indexes) will be preserved.\nContinue? [y/N]: ")
-        
-        if response.lower() != 'y':
-            logger.info("❌ Cleanup cancelled")
-            return
+        if not skip_confirmation:
+            response = input(f"\n⚠️  This will DELETE all {node_count} nodes and {rel_count} relationships.\nSchema (constraints/indexes) will be preserved.\nContinue? [y/N]: ")
+            
+            if response.lower() != 'y':
+                logger.info("❌ Cleanup cancelled")
+                return
         
         # Perform cleanup
-        cleaner.clear_all_data()
-        cleaner.verify_cleanup()
+        await cleaner.clear_all_data()
+        await cleaner.verify_cleanup()
         
         logger.info("\n🎉 Knowledge graph cleanup complete!")
         logger.info("To repopulate data, run: python scripts/setup_knowledge_graph.py")
@@ -136,7 +167,7 @@ def main():
         sys.exit(1)
     finally:
         if 'cleaner' in locals():
-            cleaner.close()
+            await cleaner.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,30 @@
+"""
+Shared Neo4j driver for the knowledge graph scripts
+Creates one pooled async driver per process so every script reuses its connections
+"""
+
+# Connection pool settings sized for short-lived scripts
+DRIVER_CONFIG = {
+    "max_connection_pool_size": 16,
+    "connection_acquisition_timeout": 30,
+    "max_connection_lifetime": 600,
+    "keep_alive": True
+}
+
+_driver = None
+
+def get_driver(uri, user, password):
+    """Return the process-wide async Neo4j driver, creating it on first use"""
+    global _driver
+    if _driver is None:
+        # Deferred so argument parsing and config errors don't pay for the driver import
+        from neo4j import AsyncGraphDatabase
+        _driver = AsyncGraphDatabase.driver(uri, auth=(user, password), **DRIVER_CONFIG)
+    return _driver
+
+async def close_driver():
+    """Close the process-wide Neo4j driver if it was created"""
+    global _driver
+    if _driver is not None:
+        await _driver.close()
+        _driver = None
@@ -4,12 +4,14 @@ Setup Knowledge Graph for GraphRAG Demonstration
 Loads schema and sample data into Neo4j
 """
 
+import asyncio
 import os
+import re
 import sys
 from pathlib import Path
-from neo4j import GraphDatabase
 import logging
 from dotenv import load_dotenv
+from graph_driver import close_driver, get_driver
 
 # Load environment variables from .env file
 load_dotenv()
@@ -18,6 +20,120 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Matches single-node statements like: CREATE (:Paper {id: "x", year: 2023})
+NODE_CREATE_PATTERN = re.compile(r"^CREATE\s*\(\s*:\s*(\w+)\s*\{(.*)\}\s*\)$", re.DOTALL)
+# Matches one "key: literal" entry of a Cypher map literal
+MAP_ENTRY_PATTERN = re.compile(
+    r"""\s*(\w+)\s*:\s*("(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|-?\d+(?:\.\d+)?|true|false)\s*(?:,|$)""",
+    re.DOTALL
+)
+
+def split_cypher_statements(cypher_content):
+    """Split a Cypher script into statements, dropping comments.
+    
+    Semicolons and comment markers inside string literals are kept.
+    """
+    statements = []
+    current = []
+    i = 0
+    quote = None
+    
+    while i < len(cypher_content):
+        char = cypher_content[i]
+        pair = cypher_content[i:i + 2]
+        
+        if quote:
+            current.append(char)
+            if char == "\\" and i + 1 < len(cypher_content):
+                current.append(cypher_content[i + 1])
+                i += 1
+            elif char == quote:
+                quote = None
+        elif char in "\"'`":
+            quote = char
+            current.append(char)
+        elif pair == "//":
+            end = cypher_content.find("\n", i)
+            i = len(cypher_content) if end == -1 else end
+            continue
+        elif pair == "/*":
+            end = cypher_content.find("*/", i + 2)
+            i = len(cypher_content) if end == -1 else end + 2
+            continue
+        elif char == ";":
+            statements.append("".join(current).strip())
+            current = []
+        else:
+            current.append(char)
+        i += 1
+    
+    statements.append("".join(current).strip())
+    return [stmt for stmt in statements if stmt]
+
+def parse_node_create(statement):
+    """Return (label, properties) for a literal single-node CREATE, else None"""
+    match = NODE_CREATE_PATTERN.match(statement)
+    if not match:
+        return None
+    
+    label, body = match.groups()
+    properties = {}
+    position = 0
+    body = body.strip()
+    while position < len(body):
+        entry = MAP_ENTRY_PATTERN.match(body, position)
+        if not entry:
+            return None
+        key, value = entry.groups()
+        if value[0] in "\"'":
+            text = value[1:-1]
+            # Only quote and backslash escapes are decoded here; leave anything
+            # else (\n, \t, \uXXXX) to Neo4j by running the statement unbatched
+            if any(escape not in "\\'\"" for escape in re.findall(r"\\(.)", text)):
+                return None
+            properties[key] = re.sub(r"\\(.)", r"\1", text)
+        elif value in ("true", "false"):
+            properties[key] = value == "true"
+        elif "." in value:
+            properties[key] = float(value)
+        else:
+            properties[key] = int(value)
+        position = entry.end()
+    
+    return label, properties
+
+def batch_node_creates(statements):
+    """Group consecutive single-node CREATEs per label.
+    
+    Returns (label, rows) for each node batch and (None, statement) for any
+    other statement, in the original statement order.
+    """
+    batched = []
+    label, rows = None, []
+    
+    def flush():
+        if rows:
+            batched.append((label, list(rows)))
+            rows.clear()
+    
+    for statement in statements:
+        node = parse_node_create(statement)
+        if node is None:
+            flush()
+            batched.append((None, statement))
+            continue
+        if node[0] != label:
+            flush()
+            label = node[0]
+        rows.append(node[1])
+    
+    flush()
+    return batched
+
+def node_batch_query(label):
+    """Build the UNWIND query that creates one node per row"""
+    return f"UNWIND $rows AS row CREATE (n:`{label}`) SET n = row"
+
 class KnowledgeGraphSetup:
     def __init__(self, uri=None, user=None, password=None):
         """Initialize Neo4j connection using environment variables"""
@@ -29,32 +145,97 @@ class KnowledgeGraphSetup:
             raise ValueError("NEO4J_USER and NEO4J_PASSWORD environment variables must be set")
         
         logger.info(f"Connecting to Neo4j at {self.uri} as {self.user}")
-        self.driver = GraphDatabase.driver(self.uri, auth=(self.user, self.password))
+        self.driver = get_driver(self.uri, self.user, self.password)
+        self.apoc_batch_size = int(os.getenv("NEO4J_APOC_BATCH_SIZE", "1000"))
+        self._apoc_available = None
         
-    def close(self):
+    async def close(self):
         """Close the connection"""
-        self.driver.close()
+        await close_driver()
+    
+    async def has_apoc(self):
+        """Check whether the APOC procedures are installed"""
+        if self._apoc_available is None:
+            try:
+                async with self.driver.session() as session:
+                    result = await session.run("CALL apoc.help('periodic')")
+                    await result.consume()
+                self._apoc_available = True
+            except Exception as e:
+                logger.debug(f"APOC not available: {e}")
+                self._apoc_available = False
+        return self._apoc_available
     
-    def run_cypher_file(self, file_path):
-        """Execute a Cypher script file"""
+    async def create_nodes_with_apoc(self, label, rows):
+        """Create nodes through apoc.periodic.iterate in parallel batches"""
+        async with self.driver.session() as session:
+            result = await session.run(
+                "CALL apoc.periodic.iterate($outer, $inner, "
+                "{batchSize: $batch_size, parallel: true, params: {rows: $rows}}) "
+                "YIELD failedOperations, errorMessages",
+                outer="UNWIND $rows AS row RETURN row",
+                inner=f"CREATE (n:`{label}`) SET n = row",
+                batch_size=self.apoc_batch_size,
+                rows=rows
+            )
+            result = await result.single()
+        
+        if result["failedOperations"]:
+            raise RuntimeError(f"Failed to create {label} nodes: {result['errorMessages']}")
+        logger.debug(f"Created {len(rows)} {label} nodes with APOC")
+    
+    async def run_cypher_file(self, file_path, single_transaction=False):
+        """Execute a Cypher script file
+        
+        Consecutive node CREATEs are sent as one UNWIND query per label, or
+        through apoc.periodic.iterate when APOC is installed. APOC commits in
+        its own transactions, so those node batches run before the remaining
+        statements. With single_transaction the remaining statements commit
+        (or roll back) together; otherwise each statement auto-commits and
+        errors are logged and skipped. Schema statements cannot share a
+        transaction with data writes.
+        """
         logger.info(f"Executing Cypher script: {file_path}")
         
         try:
             with open(file_path, 'r') as file:
                 cypher_content = file.read()
             
-            # Split by semicolon and execute each statement
-            statements = [stmt.strip() for stmt in cypher_content.split(';') if stmt.strip()]
+            statements = split_cypher_statements(cypher_content)
+            batches = batch_node_creates(statements)
+            logger.info(f"Running {len(statements)} statements as {len(batches)} queries")
+            
+            if any(label for label, _ in batches) and await self.has_apoc():
+                # Labels never overlap, so their batches load concurrently.
+                # Relationship statements stay sequential below so parallel
+                # writes never touch overlapping nodes.
+                await asyncio.gather(*[
+                    self.create_nodes_with_apoc(label, rows)
+                    for label, rows in batches if label
+                ])
+                batches = [batch for batch in batches if not batch[0]]
             
-            with self.driver.session() as session:
-                for i, statement in enumerate(statements):
-                    if statement:
+            queries = [
+                (node_batch_query(label), {"rows": payload}) if label else (payload, {})
+                for label, payload in batches
+            ]
+            
+            async with self.driver.session() as session:
+                if single_transaction:
+                    async with await session.begin_transaction() as tx:
+                        for query, parameters in queries:
+                            result = await tx.run(query, parameters)
+                            await result.consume()
+                        await tx.commit()
+                else:
+                    for i, (query, parameters) in enumerate(queries):
                         try:
-                            result = session.run(statement)
+                            result = await session.run(query, parameters)
+                            await result.consume()
                             logger.debug(f"Statement {i+1} executed successfully")
                         except Exception as e:
                             logger.error(f"Error in statement {i+1}: {e}")
-                            logger.error(f"Statement: {statement[:100]}...")
+                            logger.error(f"Statement: {query[:100]}...")
                             
             logger.info(f"Completed executing {file_path}")
             
@@ -65,28 +246,30 @@ class KnowledgeGraphSetup:
             logger.error(f"Error executing {file_path}: {e}")
             raise
     
-    def verify_setup(self):
+    async def verify_setup(self):
         """Verify the knowledge graph was created correctly"""
         logger.info("Verifying knowledge graph setup...")
         
-        queries = [
-            ("Papers", "MATCH (p:Paper) RETURN count(p) as count"),
-            ("Authors", "MATCH (a:Author) RETURN count(a) as count"),
-            ("Institutions", "MATCH (i:Institution) RETURN count(i) as count"),
-            ("Topics", "MATCH (t:Topic) RETURN count(t) as count"),
-            ("Venues", "MATCH (v:Venue) RETURN count(v) as count"),
-            ("Relationships", "MATCH ()-[r]->() RETURN count(r) as count")
-        ]
-        
-        with self.driver.session() as session:
-            for name, query in queries:
-                result = session.run(query)
-                count = result.single()["count"]
+        # One round-trip; each subquery is answered from the count store
+        query = """
+        CALL { MATCH (p:Paper) RETURN count(p) AS Papers }
+        CALL { MATCH (a:Author) RETURN count(a) AS Authors }
+        CALL { MATCH (i:Institution) RETURN count(i) AS Institutions }
+        CALL { MATCH (t:Topic) RETURN count(t) AS Topics }
+        CALL { MATCH (v:Venue) RETURN count(v) AS Venues }
+        CALL { MATCH ()-[r]->() RETURN count(r) AS Relationships }
+        RETURN Papers, Authors, Institutions, Topics, Venues, Relationships
+        """
+        
+        async with self.driver.session() as session:
+            result = await session.run(query)
+            record = await result.single()
+            for name, count in record.items():
                 logger.info(f"{name}: {count}")
         
         logger.info("Knowledge graph verification complete!")
 
-def main():
+async def main():
     """Main setup function"""
     # Get script directory
     script_dir = Path(__file__).parent
@@ -97,21 +280,21 @@ def main():
         
         # Test connection
         logger.info("Testing Neo4j connection...")
-        with kg_setup.driver.session() as session:
-            result = session.run("RETURN 'Connection successful' as message")
-            message = result.single()["message"]
+        async with kg_setup.driver.session() as session:
+            result = await session.run("RETURN 'Connection successful' as message")
+            message = (await result.single())["message"]
             logger.info(f"✅ {message}")
         
         # Execute schema creation
         schema_file = script_dir / "01_create_schema.cypher"
-        kg_setup.run_cypher_file(schema_file)
+        await kg_setup.run_cypher_file(schema_file)
         
         # Execute data population
         data_file = script_dir / "02_populate_data.cypher"
-        kg_setup.run_cypher_file(data_file)
+        await kg_setup.run_cypher_file(data_file, single_transaction=True)
         
         # Verify setup
-        kg_setup.verify_setup()
+        await kg_setup.verify_setup()
         
         logger.info("🎉 Knowledge graph setup complete!")
         logger.info("You can now:")
@@ -127,7 +310,7 @@ def main():
         sys.exit(1)
     finally:
         if 'kg_setup' in locals():
-            kg_setup.close()
+            await kg_setup.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,79 @@
+"""
+Embedding-similarity cache for generation responses
+Returns a stored response when a new prompt is close enough in meaning to one
+already answered under the same model and settings
+"""
+
+import asyncio
+import itertools
+import logging
+import math
+import operator
+from typing import Any, Awaitable, Callable, List, Optional, Sequence, Tuple
+
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+def normalize(vector: Sequence[float]) -> Tuple[float, ...]:
+    """Scale a vector to unit length so a dot product is the cosine similarity"""
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return tuple(x / norm for x in vector)
+
+class SemanticCache:
+    """Nearest-neighbour response cache keyed by prompt embeddings"""
+    
+    def __init__(self,
+                 embed: Callable[[str], Awaitable[List[float]]],
+                 threshold: float = 0.95,
+                 maxsize: int = 512,
+                 ttl: float = 3600):
+        self.embed = embed
+        self.threshold = threshold
+        # id -> (namespace, unit vector, value); scanned exactly, without an
+        # index library. The scan runs in a worker thread so it doesn't stall
+        # the event loop; entries are only read and written on the loop.
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._ids = itertools.count()
+    
+    def candidates(self, namespace: bytes) -> List[Tuple[Tuple[float, ...], Any]]:
+        """Snapshot the live (vector, value) pairs stored under a namespace"""
+        self.entries.expire()
+        return [
+            (entry_vector, value)
+            for entry_namespace, entry_vector, value in self.entries.values()
+            if entry_namespace == namespace
+        ]
+    
+    def best_match(self,
+                   vector: Tuple[float, ...],
+                   candidates: List[Tuple[Tuple[float, ...], Any]]) -> Optional[Any]:
+        """Return the most similar candidate value above the threshold, if any"""
+        best_value, best_score = None, self.threshold
+        for entry_vector, value in candidates:
+            score = sum(map(operator.mul, vector, entry_vector))
+            if score >= best_score:
+                best_value, best_score = value, score
+        
+        return best_value
+    
+    async def get_or_compute(self,
+                             namespace: bytes,
+                             text: str,
+                             compute: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Return (value, cache_hit), computing and storing the value on a miss"""
+        try:
+            vector = normalize(await self.embed(text))
+        except Exception as e:
+            # An embedding failure shouldn't fail the request
+            logger.warning("Semantic cache unavailable: %s", e)
+            return await compute(), False
+        
+        candidates = self.candidates(namespace)
+        value = await asyncio.to_thread(self.best_match, vector, candidates) if candidates else None
+        if value is not None:
+            return value, True
+        
+        value = await compute()
+        self.entries[next(self._ids)] = (namespace, vector, value)
+        return value, False
@@ -5,170 +5,317 @@ Works with your existing Ollama setup
 """
 
 import asyncio
-import json
+import atexit
+import hashlib
 import logging
-from typing import Dict, List, Optional
+import logging.handlers
+import os
+import queue
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
 
 import httpx
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+import orjson
+from cachetools import TTLCache
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, field_validator
 import uvicorn
 
+from ollama_client import OllamaClient, OllamaUnavailableError
+from semantic_cache import SemanticCache
+
+def configure_logging():
+    """Log through a queue so request handlers never block on stream writes
+    
+    The message is merged with its arguments on the calling thread; the
+    stream write (and its lock) happens on a listener thread. The level
+    defaults to WARNING; set LOG_LEVEL=INFO for startup and connection messages.
+    """
+    root = logging.getLogger()
+    # The module is imported twice when run as a script (as __main__, then by
+    # uvicorn), so only install the queue handler once per process
+    if any(isinstance(handler, logging.handlers.QueueHandler) for handler in root.handlers):
+        return
+    
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(os.getenv("LOG_LEVEL", "WARNING").upper())
+
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+configure_logging()
 logger = logging.getLogger(__name__)
 
+# Model used when a request doesn't name one, and warmed up on startup
+DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", "llama3.2:latest")
+
 class GenerateRequest(BaseModel):
     prompt: str
-    model: str = "llama3.2:latest"
+    model: str = DEFAULT_MODEL
     temperature: float = 0.7
     max_tokens: Optional[int] = None
     context: Optional[str] = None
     system_prompt: Optional[str] = None
+    cacheable: bool = False  # cache the response even when temperature > 0
 
 class ChatMessage(BaseModel):
     role: str  # system, user, assistant
     content: str
 
+CHAT_ROLES = frozenset({"system", "user", "assistant"})
+MESSAGE_KEYS = {"role", "content"}
+
 class ChatRequest(BaseModel):
-    messages: List[ChatMessage]
-    model: str = "llama3.2:latest" 
+    # Plain dicts are passed to Ollama as-is, without building a model per message
+    messages: List[Dict[str, str]]
+    model: str = DEFAULT_MODEL
     temperature: float = 0.7
     max_tokens: Optional[int] = None
+    cacheable: bool = False  # cache the response even when temperature > 0
+    
+    @field_validator("messages")
+    @classmethod
+    def check_messages(cls, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Require exactly a known role and content on every message"""
+        for message in messages:
+            if message.keys() != MESSAGE_KEYS:
+                raise ValueError("every message needs exactly role and content")
+            if message["role"] not in CHAT_ROLES:
+                raise ValueError(f"role must be one of {sorted(CHAT_ROLES)}")
+        return messages
+
+class GenerateResponse(BaseModel):
+    text: str
+    model: str
+    eval_count: int = 0
+    eval_duration_ms: float = 0.0
+
+class ChatResponse(BaseModel):
+    message: ChatMessage
+    model: str
+    eval_count: int = 0
+    eval_duration_ms: float = 0.0
+
+# Exact-match response caches, keyed by a hash of the request payload
+_GENERATE_CACHE = TTLCache(maxsize=1024, ttl=3600)
+_CHAT_CACHE = TTLCache(maxsize=1024, ttl=3600)
+# The model list only changes when a model is pulled, and health probes can
+# arrive in bursts, so both are served from short-lived caches
+_MODELS_CACHE = TTLCache(maxsize=1, ttl=30)
+_HEALTH_CACHE = TTLCache(maxsize=1, ttl=5)
 
-class OllamaClient:
-    """Simple Ollama client"""
+# Pre-serialized /health bodies
+_HEALTH_BODIES = {
+    True: orjson.dumps({"status": "healthy", "ollama_connected": True}),
+    False: orjson.dumps({"status": "unhealthy", "ollama_connected": False})
+}
+_CACHE_LOCKS: Dict[bytes, asyncio.Lock] = {}
+
+# Near-duplicate prompts are only served from the semantic cache when sampling
+# is close to deterministic
+SEMANTIC_CACHE_MAX_TEMPERATURE = 0.3
+
+def request_cache_key(request: BaseModel) -> bytes:
+    """Hash the canonicalized request payload"""
+    payload = orjson.dumps(request.model_dump(exclude={"cacheable"}), option=orjson.OPT_SORT_KEYS)
+    return hashlib.blake2b(payload, digest_size=16).digest()
+
+def semantic_cache_key(request: BaseModel) -> Optional[Tuple[bytes, str]]:
+    """Split a request into (namespace, text to embed) for the semantic cache
     
-    def __init__(self, base_url: str = "http://localhost:11434"):
-        self.base_url = base_url.rstrip("/")
-        self.client = httpx.AsyncClient(timeout=60.0)
+    The namespace hashes everything except the prompt (or the last chat
+    message) and the temperature, so only the question itself is compared.
+    """
+    data = request.model_dump(exclude={"cacheable", "temperature"})
+    if isinstance(request, ChatRequest):
+        if not data["messages"]:
+            return None
+        text = data["messages"].pop()["content"]
+    else:
+        text = data.pop("prompt")
     
-    async def list_models(self):
-        """List available models"""
-        try:
-            response = await self.client.get(f"{self.base_url}/api/tags")
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            logger.error(f"Failed to list models: {e}")
-            raise
+    namespace = hashlib.blake2b(orjson.dumps(data, option=orjson.OPT_SORT_KEYS), digest_size=16).digest()
+    return namespace, text
+
+async def get_or_compute(cache: TTLCache, key: bytes, compute: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+    """Return (value, cache_hit), computing the value once per key on a miss"""
+    if key in cache:
+        return cache[key], True
+    
+    # Concurrent misses on the same key wait for the first computation
+    lock = _CACHE_LOCKS.setdefault(key, asyncio.Lock())
+    try:
+        async with lock:
+            if key in cache:
+                return cache[key], True
+            value = await compute()
+            cache[key] = value
+            return value, False
+    finally:
+        if not lock.locked():
+            _CACHE_LOCKS.pop(key, None)
+
+async def cached_response(request: BaseModel,
+                          cache: TTLCache,
+                          compute: Callable[[], Awaitable[bytes]],
+                          semantic_cache: Optional[SemanticCache]) -> Tuple[bytes, Optional[str]]:
+    """Return (body, X-Cache status), using the exact and semantic caches when eligible"""
+    status = None
+    
+    semantic_key = None
+    if semantic_cache is not None and request.temperature <= SEMANTIC_CACHE_MAX_TEMPERATURE:
+        semantic_key = semantic_cache_key(request)
     
-    async def generate(self, 
-                      prompt: str, 
-                      model: str = "llama3.2:latest",
-                      system: Optional[str] = None,
-                      context: Optional[str] = None,
-                      temperature: float = 0.7,
-                      max_tokens: Optional[int] = None):
-        """Generate text"""
+    async def compute_or_match():
+        nonlocal status
+        if semantic_key is None:
+            return await compute()
+        body, hit = await semantic_cache.get_or_compute(*semantic_key, compute)
+        status = "semantic-hit" if hit else "miss"
+        return body
+    
+    # Only deterministic (or explicitly cacheable) requests are cached exactly
+    if request.temperature == 0 or request.cacheable:
+        body, hit = await get_or_compute(cache, request_cache_key(request), compute_or_match)
+        return body, "hit" if hit else (status or "miss")
+    
+    return await compute_or_match(), status
+
+async def load_tokenizer(ollama: OllamaClient) -> Optional[Any]:
+    """Load the local tokenizer used to reject oversized prompts, if configured
+    
+    Needs TOKENIZER_NAME (a Hugging Face tokenizer id) and OLLAMA_NUM_CTX, plus
+    the optional `tokenizers` package.
+    """
+    tokenizer_name = os.getenv("TOKENIZER_NAME")
+    if not tokenizer_name or not ollama.num_ctx:
+        return None
+    
+    try:
+        from tokenizers import Tokenizer
+        # Downloads the tokenizer on first use, so keep it off the event loop
+        return await asyncio.to_thread(Tokenizer.from_pretrained, tokenizer_name)
+    except Exception as e:
+        logger.warning("Prompt size check disabled, could not load tokenizer %s: %s", tokenizer_name, e)
+        return None
+
+def check_prompt_size(ollama: OllamaClient, tokenizer: Optional[Any], texts: List[Optional[str]]):
+    """Reject a prompt that can't fit in the context window before calling Ollama"""
+    if tokenizer is None:
+        return
+    
+    encodings = tokenizer.encode_batch([text for text in texts if text], add_special_tokens=False)
+    token_count = sum(len(encoding.ids) for encoding in encodings)
+    if token_count > ollama.num_ctx:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Prompt has {token_count} tokens, max {ollama.num_ctx}"
+        )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create the Ollama client on startup and close it on shutdown"""
+    # One pooled client per worker process, reused by every request
+    ollama = OllamaClient(
+        limits=httpx.Limits(
+            max_connections=256,
+            max_keepalive_connections=64,
+            keepalive_expiry=30.0
+        ),
+        http2=True,
+        timeout=httpx.Timeout(connect=5.0, read=120.0, write=10.0, pool=5.0),
+        max_inflight=int(os.getenv("OLLAMA_MAX_INFLIGHT", "4")),
+        model_slots=int(os.getenv("OLLAMA_SLOTS", "2")),
+        keep_alive=os.getenv("OLLAMA_KEEP_ALIVE", "60m"),
+        num_ctx=int(os.getenv("OLLAMA_NUM_CTX", "0")) or None
+    )
+    async with ollama:
+        app.state.ollama = ollama
         
-        # Prepare the full prompt with context if provided
-        full_prompt = prompt
-        if context:
-            full_prompt = f"Context:\n{context}\n\nQuestion: {prompt}"
+        # Semantic caching is opt-in; it costs an embedding call per request
+        embedding_model = os.getenv("SEMANTIC_CACHE_MODEL")
+        app.state.semantic_cache = SemanticCache(
+            embed=lambda text: ollama.embed(text, model=embedding_model),
+            threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+        ) if embedding_model else None
+        app.state.tokenizer = await load_tokenizer(ollama)
         
-        payload = {
-            "model": model,
-            "prompt": full_prompt,
-            "stream": False,
-            "options": {
-                "temperature": temperature
-            }
-        }
+        # The root response never changes, so serialize it once
+        app.state.root_body = orjson.dumps({
+            "service": "GraphRAG Generation Server",
+            "status": "running",
+            "ollama_url": ollama.base_url
+        })
         
-        if system:
-            payload["system"] = system
+        # Check Ollama connection on startup
+        health = await ollama.check_health()
+        if not health:
+            logger.warning("Ollama service not accessible at startup!")
+        else:
+            models = await ollama.list_models()
+            model_count = len(models.get("models", []))
+            logger.info("Connected to Ollama. Available models: %d", model_count)
             
-        if max_tokens:
-            payload["options"]["num_predict"] = max_tokens
-        
-        try:
-            response = await self.client.post(
-                f"{self.base_url}/api/generate",
-                json=payload
-            )
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            logger.error(f"Generation failed: {e}")
-            raise
-    
-    async def chat(self, 
-                   messages: List[Dict[str, str]], 
-                   model: str = "llama3.2:latest",
-                   temperature: float = 0.7,
-                   max_tokens: Optional[int] = None):
-        """Chat completion"""
+            # Load the default model now so the first request doesn't pay for
+            # it; keep_alive then keeps it resident
+            try:
+                await ollama.generate(prompt=".", model=DEFAULT_MODEL, max_tokens=1)
+                logger.info("Warmed up %s", DEFAULT_MODEL)
+            except Exception as e:
+                logger.warning("Could not warm up %s: %s", DEFAULT_MODEL, e)
         
-        payload = {
-            "model": model,
-            "messages": messages,
-            "stream": False,
-            "options": {
-                "temperature": temperature
-            }
-        }
-        
-        if max_tokens:
-            payload["options"]["num_predict"] = max_tokens
-        
-        try:
-            response = await self.client.post(
-                f"{self.base_url}/api/chat",
-                json=payload
-            )
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            logger.error(f"Chat completion failed: {e}")
-            raise
-    
-    async def check_health(self):
-        """Check if Ollama is accessible"""
-        try:
-            response = await self.client.get(f"{self.base_url}/api/version")
-            return response.status_code == 200
-        except Exception:
-            return False
-
-# Initialize FastAPI app and Ollama client
-app = FastAPI(title="GraphRAG Generation Server", version="1.0.0")
-ollama = OllamaClient()
-
-@app.on_event("startup")
-async def startup_event():
-    """Check Ollama connection on startup"""
-    health = await ollama.check_health()
-    if not health:
-        logger.warning("Ollama service not accessible at startup!")
-    else:
-        models = await ollama.list_models()
-        model_count = len(models.get("models", []))
-        logger.info(f"Connected to Ollama. Available models: {model_count}")
+        yield
+
+# Initialize FastAPI app
+app = FastAPI(
+    title="GraphRAG Generation Server",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
+)
+
+def unavailable(error: OllamaUnavailableError) -> HTTPException:
+    """503 telling the caller when to retry, once Ollama retries are exhausted"""
+    return HTTPException(
+        status_code=503,
+        detail=str(error),
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+async def get_ollama(request: Request) -> OllamaClient:
+    """Endpoint dependency returning the worker's Ollama client"""
+    return request.app.state.ollama
+
+async def get_semantic_cache(request: Request) -> Optional[SemanticCache]:
+    """Endpoint dependency returning the semantic cache, or None when disabled"""
+    return request.app.state.semantic_cache
+
+async def get_tokenizer(request: Request) -> Optional[Any]:
+    """Endpoint dependency returning the prompt-size tokenizer, or None when disabled"""
+    return request.app.state.tokenizer
 
 @app.get("/")
-async def root():
+async def root(request: Request):
     """Root endpoint"""
-    return {
-        "service": "GraphRAG Generation Server",
-        "status": "running",
-        "ollama_url": ollama.base_url
-    }
+    return Response(content=request.app.state.root_body, media_type="application/json")
 
 @app.get("/health")
-async def health_check():
+async def health_check(ollama: OllamaClient = Depends(get_ollama)):
     """Health check endpoint"""
-    ollama_healthy = await ollama.check_health()
-    return {
-        "status": "healthy" if ollama_healthy else "unhealthy",
-        "ollama_connected": ollama_healthy
-    }
+    ollama_healthy, _ = await get_or_compute(_HEALTH_CACHE, b"health", ollama.check_health)
+    return Response(content=_HEALTH_BODIES[ollama_healthy], media_type="application/json")
 
 @app.get("/models")
-async def list_models():
+async def list_models(ollama: OllamaClient = Depends(get_ollama)):
     """List available models"""
     try:
-        models_response = await ollama.list_models()
+        models_response, _ = await get_or_compute(_MODELS_CACHE, b"models", ollama.list_models)
         models = models_response.get("models", [])
         return {
             "models": [model.get("name") for model in models],
@@ -177,10 +324,16 @@ async def list_models():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to list models: {str(e)}")
 
-@app.post("/generate")
-async def generate_text(request: GenerateRequest):
-    """Generate text using Ollama"""
-    try:
+@app.get("/metrics")
+async def metrics(ollama: OllamaClient = Depends(get_ollama)):
+    """Generation queue depth per model for this worker"""
+    return ollama.metrics()
+
+async def generate_response(request: GenerateRequest,
+                            ollama: OllamaClient,
+                            semantic_cache: Optional[SemanticCache]) -> Tuple[bytes, Optional[str]]:
+    """Run one generation through the caches, returning (body, X-Cache status)"""
+    async def generate():
         result = await ollama.generate(
             prompt=request.prompt,
             model=request.model,
@@ -190,45 +343,172 @@ async def generate_text(request: GenerateRequest):
             max_tokens=request.max_tokens
         )
         
-        return {
+        # Serialized here so large outputs skip response_model validation;
+        # GenerateResponse still documents the shape
+        return orjson.dumps({
             "text": result.get("response", ""),
             "model": request.model,
             "eval_count": result.get("eval_count", 0),
             "eval_duration_ms": result.get("eval_duration", 0) / 1e6
-        }
+        })
+    
+    return await cached_response(request, _GENERATE_CACHE, generate, semantic_cache)
+
+@app.post("/generate", response_model=GenerateResponse)
+async def generate_text(request: GenerateRequest,
+                        ollama: OllamaClient = Depends(get_ollama),
+                        semantic_cache: Optional[SemanticCache] = Depends(get_semantic_cache),
+                        tokenizer: Optional[Any] = Depends(get_tokenizer)):
+    """Generate text using Ollama"""
+    check_prompt_size(ollama, tokenizer, [request.system_prompt, request.context, request.prompt])
+    
+    try:
+        body, cache_status = await generate_response(request, ollama, semantic_cache)
+        headers = {"X-Cache": cache_status} if cache_status else {}
+        return Response(content=body, media_type="application/json", headers=headers)
         
+    except OllamaUnavailableError as e:
+        raise unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Generation failed: {str(e)}")
 
-@app.post("/chat")
-async def chat_completion(request: ChatRequest):
-    """Chat completion using Ollama"""
+@app.post("/generate/batch", response_model=List[GenerateResponse])
+async def generate_text_batch(requests: List[GenerateRequest],
+                              ollama: OllamaClient = Depends(get_ollama),
+                              semantic_cache: Optional[SemanticCache] = Depends(get_semantic_cache),
+                              tokenizer: Optional[Any] = Depends(get_tokenizer)):
+    """Generate text for several prompts concurrently, in request order"""
+    for request in requests:
+        check_prompt_size(ollama, tokenizer, [request.system_prompt, request.context, request.prompt])
+    
     try:
-        # Convert Pydantic models to dict
-        messages = [{"role": msg.role, "content": msg.content} for msg in request.messages]
+        # Each generation still waits for its model's slot, so the batch
+        # can't overrun Ollama however large it is
+        tasks = [asyncio.ensure_future(generate_response(request, ollama, semantic_cache)) for request in requests]
+        try:
+            results = await asyncio.gather(*tasks)
+        except Exception:
+            # gather doesn't cancel the other items when one fails, so stop
+            # them before they hold model slots for a response nobody reads
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        body = b"[" + b",".join(body for body, _ in results) + b"]"
+        return Response(content=body, media_type="application/json")
         
+    except OllamaUnavailableError as e:
+        raise unavailable(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Batch generation failed: {str(e)}")
+
+async def sse_events(first: Optional[str], lines: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Wrap NDJSON lines as Server-Sent Events"""
+    try:
+        if first is not None:
+            yield f"data: {first}\n\n"
+        async for line in lines:
+            yield f"data: {line}\n\n"
+    except Exception as e:
+        # Headers are already sent, so report the failure as a final event
+        yield f"data: {orjson.dumps({'error': str(e), 'done': True}).decode()}\n\n"
+    finally:
+        await lines.aclose()
+
+async def event_stream(lines: AsyncIterator[str], error_prefix: str) -> StreamingResponse:
+    """Start the upstream call before responding, then stream the rest as SSE
+    
+    Waiting for the first line means connection failures and exhausted
+    retries still get a real status code instead of a 200 with an error event.
+    """
+    try:
+        first = await lines.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except OllamaUnavailableError as e:
+        raise unavailable(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"{error_prefix}: {str(e)}")
+    
+    return StreamingResponse(sse_events(first, lines), media_type="text/event-stream")
+
+@app.post("/generate/stream")
+async def generate_text_stream(request: GenerateRequest,
+                               ollama: OllamaClient = Depends(get_ollama),
+                               tokenizer: Optional[Any] = Depends(get_tokenizer)):
+    """Stream generated text as Server-Sent Events"""
+    check_prompt_size(ollama, tokenizer, [request.system_prompt, request.context, request.prompt])
+    lines = ollama.generate_stream(
+        prompt=request.prompt,
+        model=request.model,
+        system=request.system_prompt,
+        context=request.context,
+        temperature=request.temperature,
+        max_tokens=request.max_tokens
+    )
+    return await event_stream(lines, "Generation failed")
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat_completion(request: ChatRequest,
+                          ollama: OllamaClient = Depends(get_ollama),
+                          semantic_cache: Optional[SemanticCache] = Depends(get_semantic_cache),
+                          tokenizer: Optional[Any] = Depends(get_tokenizer)):
+    """Chat completion using Ollama"""
+    check_prompt_size(ollama, tokenizer, [message["content"] for message in request.messages])
+    
+    async def chat():
         result = await ollama.chat(
-            messages=messages,
+            messages=request.messages,
             model=request.model,
             temperature=request.temperature,
             max_tokens=request.max_tokens
         )
         
-        return {
+        # Serialized here so large outputs skip response_model validation;
+        # ChatResponse still documents the shape
+        return orjson.dumps({
             "message": result.get("message", {}),
             "model": request.model,
             "eval_count": result.get("eval_count", 0),
             "eval_duration_ms": result.get("eval_duration", 0) / 1e6
-        }
+        })
+    
+    try:
+        body, cache_status = await cached_response(request, _CHAT_CACHE, chat, semantic_cache)
+        headers = {"X-Cache": cache_status} if cache_status else {}
+        return Response(content=body, media_type="application/json", headers=headers)
         
+    except OllamaUnavailableError as e:
+        raise unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Chat completion failed: {str(e)}")
 
+@app.post("/chat/stream")
+async def chat_completion_stream(request: ChatRequest,
+                                 ollama: OllamaClient = Depends(get_ollama),
+                                 tokenizer: Optional[Any] = Depends(get_tokenizer)):
+    """Stream a chat completion as Server-Sent Events"""
+    check_prompt_size(ollama, tokenizer, [message["content"] for message in request.messages])
+    lines = ollama.chat_stream(
+        messages=request.messages,
+        model=request.model,
+        temperature=request.temperature,
+        max_tokens=request.max_tokens
+    )
+    return await event_stream(lines, "Chat completion failed")
+
 if __name__ == "__main__":
-    # Run the server
+    # Run the server with the httptools parser, on uvloop where it is installed
+    # (it isn't on Windows). Each worker imports the app and builds its own
+    # Ollama client in lifespan, so the generation limits apply per worker;
+    # one worker keeps them a true bound on the GPU.
     uvicorn.run(
-        app, 
-        host="127.0.0.1", 
+        "simple_generation_server:app",
+        host="127.0.0.1",
         port=8000,
-        log_level="info"
+        loop="auto",
+        http="httptools",
+        workers=int(os.getenv("WORKERS", "1")),
+        access_log=False,
+        log_level="warning"
     )
\ No newline at end of file
@@ -4,14 +4,18 @@ Test client for the GraphRAG Generation Server
 """
 
 import asyncio
-import json
 import httpx
 
 async def test_server():
     """Test the generation server endpoints"""
     base_url = "http://127.0.0.1:8000"
     
-    async with httpx.AsyncClient() as client:
+    # One pooled client so the concurrent requests share connections
+    async with httpx.AsyncClient(
+        http2=True,
+        timeout=120.0,
+        limits=httpx.Limits(max_keepalive_connections=8)
+    ) as client:
         print("🧪 Testing GraphRAG Generation Server...")
         
         # Test health
@@ -34,28 +38,14 @@ async def test_server():
             print(f"❌ Models list failed: {e}")
             return
         
-        # Test text generation
-        print("\n3. Test text generation...")
+        # The three generation requests are independent, so send them
+        # concurrently and report the results in order
         generation_request = {
             "prompt": "Explain GraphRAG in simple terms",
             "model": "llama3.2:latest",
             "temperature": 0.7
         }
         
-        try:
-            response = await client.post(
-                f"{base_url}/generate",
-                json=generation_request
-            )
-            gen_data = response.json()
-            print(f"✅ Generated text: {gen_data['text'][:200]}...")
-            print(f"📊 Tokens: {gen_data['eval_count']}, Duration: {gen_data['eval_duration_ms']:.0f}ms")
-        except Exception as e:
-            print(f"❌ Generation failed: {e}")
-            return
-        
-        # Test chat completion
-        print("\n4. Test chat completion...")
         chat_request = {
             "messages": [
                 {"role": "system", "content": "You are a helpful AI assistant specializing in knowledge graphs."},
@@ -65,35 +55,52 @@ async def test_server():
             "temperature": 0.7
         }
         
+        # GraphRAG-style generation with context
+        context_request = {
+            "prompt": "How does this relate to the knowledge graph structure?",
+            "context": "Knowledge graphs are structured representations of information that use nodes to represent entities and edges to represent relationships between those entities.",
+            "model": "llama3.2:latest",
+            "system_prompt": "You are an AI assistant that answers questions based on provided context.",
+            "temperature": 0.7
+        }
+        
+        print("\n3-5. Running text generation, chat completion and generation with context...")
+        gen_response, chat_response, context_response = await asyncio.gather(
+            client.post(f"{base_url}/generate", json=generation_request),
+            client.post(f"{base_url}/chat", json=chat_request),
+            client.post(f"{base_url}/generate", json=context_request),
+            return_exceptions=True
+        )
+        
+        # Test text generation
+        print("\n3. Test text generation...")
+        try:
+            if isinstance(gen_response, Exception):
+                raise gen_response
+            gen_data = gen_response.json()
+            print(f"✅ Generated text: {gen_data['text'][:200]}...")
+            print(f"📊 Tokens: {gen_data['eval_count']}, Duration: {gen_data['eval_duration_ms']:.0f}ms")
+        except Exception as e:
+            print(f"❌ Generation failed: {e}")
+        
+        # Test chat completion
+        print("\n4. Test chat completion...")
         try:
-            response = await client.post(
-                f"{base_url}/chat",
-                json=chat_request
-            )
-            chat_data = response.json()
+            if isinstance(chat_response, Exception):
+                raise chat_response
+            chat_data = chat_response.json()
             message_content = chat_data['message']['content']
             print(f"✅ Chat response: {message_content[:200]}...")
             print(f"📊 Tokens: {chat_data['eval_count']}, Duration: {chat_data['eval_duration_ms']:.0f}ms")
         except Exception as e:
             print(f"❌ Chat completion failed: {e}")
-            return
         
         # Test with context (GraphRAG-style)
         print("\n5. Test generation with context...")
-        context_request = {
-            "prompt": "How does this relate to the knowledge graph structure?",
-            "context": "Knowledge graphs are structured representations of information that use nodes to represent entities and edges to represent relationships between those entities.",
-            "model": "llama3.2:latest",
-            "system_prompt": "You are an AI assistant that answers questions based on provided context.",
-            "temperature": 0.7
-        }
-        
         try:
-            response = await client.post(
-                f"{base_url}/generate",
-                json=context_request
-            )
-            context_data = response.json()
+            if isinstance(context_response, Exception):
+                raise context_response
+            context_data = context_response.json()
             print(f"✅ Context-aware response: {context_data['text'][:200]}...")
             print(f"📊 Tokens: {context_data['eval_count']}, Duration: {context_data['eval_duration_ms']:.0f}ms")
         except Exception as e:
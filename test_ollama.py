@@ -4,60 +4,11 @@ Simple test script to verify Ollama integration
 """
 
 import asyncio
-import json
-import httpx
 
-class OllamaClient:
-    """Simple Ollama client for testing"""
-    
-    def __init__(self, base_url: str = "http://localhost:11434"):
-        self.base_url = base_url.rstrip("/")
-        self.client = httpx.AsyncClient(timeout=60.0)
-    
-    async def list_models(self):
-        """List available models"""
-        try:
-            response = await self.client.get(f"{self.base_url}/api/tags")
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            print(f"Failed to list models: {e}")
-            return None
-    
-    async def generate(self, prompt: str, model: str = "llama3.2:latest"):
-        """Generate text"""
-        payload = {
-            "model": model,
-            "prompt": prompt,
-            "stream": False
-        }
-        
-        try:
-            response = await self.client.post(
-                f"{self.base_url}/api/generate",
-                json=payload
-            )
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            print(f"Generation failed: {e}")
-            return None
-    
-    async def check_health(self):
-        """Check if Ollama is accessible"""
-        try:
-            response = await self.client.get(f"{self.base_url}/api/version")
-            return response.status_code == 200
-        except Exception:
-            return False
+from ollama_client import OllamaClient
 
-async def main():
-    """Test the Ollama connection and generation"""
-    print("🧪 Testing Ollama Integration...")
-    
-    # Initialize client
-    ollama = OllamaClient()
-    
+async def run_checks(ollama: OllamaClient):
+    """Check health, list models and run a test generation"""
     # Check health
     print("\n1. Checking Ollama health...")
     healthy = await ollama.check_health()
@@ -69,7 +20,11 @@ async def main():
     
     # List models
     print("\n2. Listing available models...")
-    models_response = await ollama.list_models()
+    try:
+        models_response = await ollama.list_models()
+    except Exception as e:
+        print(f"Failed to list models: {e}")
+        models_response = None
     if models_response:
         models = models_response.get("models", [])
         print(f"Found {len(models)} models:")
@@ -88,7 +43,11 @@ async def main():
     print(f"Prompt: {test_prompt}")
     print("Generating response...")
     
-    result = await ollama.generate(test_prompt)
+    try:
+        result = await ollama.generate(test_prompt)
+    except Exception as e:
+        print(f"Generation failed: {e}")
+        result = None
     if result:
         response_text = result.get("response", "")
         print(f"\n✅ Response: {response_text}")
@@ -104,5 +63,13 @@ async def main():
     
     print("\n🎉 Test complete!")
 
+async def main():
+    """Test the Ollama connection and generation"""
+    print("🧪 Testing Ollama Integration...")
+    
+    # Initialize client; the health, list and generate calls share its connection
+    async with OllamaClient() as ollama:
+        await run_checks(ollama)
+
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file